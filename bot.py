@@ -3,52 +3,140 @@ Kalshi Risk-Neutralization Trading Bot
 Implements "Free Roll" strategy: Sell enough contracts to recover initial capital when price increases 50%
 """
 
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import logging.handlers
+import math
 import os
 import sys
 import time
-from datetime import datetime
-from math import floor
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
+import httpx
+import numpy as np
+import orjson
 import requests
+import websockets
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from requests.adapters import HTTPAdapter
 from kalshi_python import KalshiClient, Configuration
 from supabase import create_client, Client
 
+log = logging.getLogger("kalshi_bot")
+
+# Environment variables the bot cannot start without
+REQUIRED_ENV_VARS = ('KALSHI_KEY', 'KALSHI_SECRET', 'SUPABASE_URL', 'SUPABASE_KEY', 'DISCORD_URL')
+
+# Cap on in-flight Kalshi/Supabase/Discord calls to stay under Kalshi's rate limit
+MAX_CONCURRENT_REQUESTS = 10
+
+# Price cache: serve fresh quotes directly, serve stale ones while refreshing in the background
+PRICE_CACHE_MAX_AGE_SECONDS = 2
+PRICE_CACHE_SWR_SECONDS = 10
+
+# Discord webhook limits: max characters in a message's content
+DISCORD_MAX_CONTENT = 2000
+DISCORD_ALERT_SEPARATOR = "\n---\n"
+
+# Kalshi REST API, called directly on the hot path (markets, orders)
+KALSHI_API_HOST = "https://demo-api.kalshi.co"
+KALSHI_API_PATH = "/trade-api/v2"
+
+# Kalshi market-data WebSocket (streaming mode)
+KALSHI_WS_URL = "wss://demo-api.kalshi.co/trade-api/ws/v2"
+KALSHI_WS_PATH = "/trade-api/ws/v2"
+
+# Streaming mode: after a failed hedge a ticker waits this long before its next attempt, doubling
+# per failure, and is dropped from tracking after MAX_HEDGE_ATTEMPTS failures
+HEDGE_RETRY_BACKOFF_SECONDS = 30
+MAX_HEDGE_ATTEMPTS = 4
+
+
+def as_int(value) -> Optional[int]:
+    """Return a JSON number as an int, or None if it is missing or not a finite number"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return int(value)
+
 
 class KalshiBot:
-    """Main trading bot class for executing risk-neutralization strategy"""
+    """
+    Main trading bot class for executing risk-neutralization strategy.
+    Single-use: run() and stream_and_hedge() close the Kalshi HTTP client when they finish,
+    so create a new KalshiBot for every run.
+    """
     
     def __init__(self):
         """Initialize bot with API credentials and clients"""
-        # 1. Load environment variables
-        self.kalshi_key = os.environ.get('KALSHI_KEY')
-        self.kalshi_secret = os.environ.get('KALSHI_SECRET')
-        self.supabase_url = os.environ.get('SUPABASE_URL')
-        self.supabase_key = os.environ.get('SUPABASE_KEY')
-        self.discord_url = os.environ.get('DISCORD_URL')
-        
-        # 2. Validate required credentials
-        self._validate_credentials()
-        
-        # 3. Initialize clients
-        self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
+        # 1. Load and validate environment variables in a single pass
+        creds = self._load_credentials()
+        
+        # 2. Store required credentials
+        self.kalshi_key = creds['KALSHI_KEY']
+        self.kalshi_secret = creds['KALSHI_SECRET']
+        self.supabase_url = creds['SUPABASE_URL']
+        self.supabase_key = creds['SUPABASE_KEY']
+        self.discord_url = creds['DISCORD_URL']
+        
+        # 3. Initialize clients (Supabase is created on first use, see the supabase property)
+        self._supabase: Optional[Client] = None
         self.kalshi_api = self._init_kalshi_client()
+        self._http = self._init_http_session()
+        self._sign = self._init_signer()
+        self._kalshi_http = httpx.AsyncClient(base_url=f"{KALSHI_API_HOST}{KALSHI_API_PATH}", http2=True, timeout=10)
+        
+        # Streaming mode state: latest yes_bid per ticker and positions still awaiting a hedge
+        self.prices: Dict[str, int] = {}  # yes_bid in cents
+        self._stream_positions: Dict[str, Dict] = {}
+        self._hedge_orders: Dict[str, List] = {}  # order_id -> [ticker, unfilled count], matched against pushed fills
         
-        print(f"[{self._timestamp()}] Bot initialized successfully")
+        # Unique client_order_id suffixes, seeded once so concurrent orders never collide
+        self._order_seq = itertools.count(int(time.time()) * 1000)
+        
+        # Hedged positions awaiting one batched Supabase upsert
+        self._pending_db_updates: List[Dict] = []
+        
+        # Discord alerts awaiting one coalesced webhook post
+        self._alert_buffer: List[str] = []
+        
+        # ticker -> (yes_bid cents, fetched_at monotonic seconds), plus in-flight background refreshes
+        self._price_cache: Dict[str, Tuple[int, float]] = {}
+        self._refreshing: Set[str] = set()
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        
+        # Streamed ticker -> (failed hedge attempts, monotonic time before which it is not retried)
+        self._hedge_failures: Dict[str, Tuple[int, float]] = {}
+        
+        log.info("Bot initialized successfully")
     
-    def _validate_credentials(self):
-        """Ensure all required environment variables are present"""
-        required = ['KALSHI_KEY', 'KALSHI_SECRET', 'SUPABASE_URL', 'SUPABASE_KEY', 'DISCORD_URL']
-        missing = [var for var in required if not os.environ.get(var)]
+    def _load_credentials(self) -> Dict[str, str]:
+        """Read all required environment variables, ensuring each one is present"""
+        creds = {var: os.environ.get(var) for var in REQUIRED_ENV_VARS}
+        missing = [var for var, value in creds.items() if not value]
         
         if missing:
             raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
+        
+        return creds
+    
+    @property
+    def supabase(self) -> Client:
+        """Supabase client, created on first access so auto-pilot runs never connect"""
+        if self._supabase is None:
+            self._supabase = create_client(self.supabase_url, self.supabase_key)
+        return self._supabase
     
     def _init_kalshi_client(self) -> KalshiClient:
         """Initialize and authenticate Kalshi API client"""
         try:
             config = Configuration(
-                host="https://demo-api.kalshi.co/trade-api/v2"
+                host=f"{KALSHI_API_HOST}{KALSHI_API_PATH}"
             )
             
             # Attach your credentials to the config
@@ -58,14 +146,57 @@ class KalshiBot:
             # Create the client with the configured credentials
             client = KalshiClient(configuration=config)
             
-            print(f"[{self._timestamp()}] Kalshi client authenticated")
+            log.info("Kalshi client authenticated")
             return client
         except Exception as e:
             raise RuntimeError(f"Failed to initialize Kalshi client: {str(e)}")
     
-    def _timestamp(self) -> str:
-        """Generate formatted timestamp for logging"""
-        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    def _init_http_session(self) -> requests.Session:
+        """Create a keep-alive HTTP session shared by all direct HTTP calls"""
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+        return session
+    
+    def _init_signer(self):
+        """Load the Kalshi RSA private key once and return a closure that signs messages with it"""
+        try:
+            private_key = serialization.load_pem_private_key(self.kalshi_secret.encode(), password=None)
+        except Exception as e:
+            raise RuntimeError(f"Failed to load Kalshi private key: {str(e)}")
+        
+        sign = private_key.sign
+        pss = padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.DIGEST_LENGTH)
+        sha256 = hashes.SHA256()
+        
+        def signer(message: bytes) -> str:
+            return base64.b64encode(sign(message, pss, sha256)).decode()
+        
+        return signer
+    
+    def _auth_headers(self, method: str, path: str) -> Dict[str, str]:
+        """Build Kalshi signed authentication headers for a request"""
+        timestamp = str(int(time.time() * 1000))
+        return {
+            'KALSHI-ACCESS-KEY': self.kalshi_key,
+            'KALSHI-ACCESS-SIGNATURE': self._sign(f"{timestamp}{method}{path}".encode()),
+            'KALSHI-ACCESS-TIMESTAMP': timestamp
+        }
+    
+    async def _kalshi_request(self, method: str, path: str, params: Optional[Dict] = None,
+                              body: Optional[Dict] = None) -> Dict:
+        """Send a signed request to the Kalshi REST API and return the decoded JSON body"""
+        headers = self._auth_headers(method, f"{KALSHI_API_PATH}{path}")
+        content = None
+        
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+            content = orjson.dumps(body)
+        
+        response = await self._kalshi_http.request(method, path, params=params, content=content, headers=headers)
+        if response.is_error:
+            log.error("Kalshi %s %s failed with %s: %s", method, path, response.status_code, response.text)
+        response.raise_for_status()
+        return orjson.loads(response.content)
     
     def fetch_open_positions(self) -> list:
         """
@@ -78,8 +209,11 @@ class KalshiBot:
         MIN_INVESTMENT_TO_HEDGE = 10  
         # ----------------
         
+        # Same threshold in the API's native unit: contracts * cents
+        MIN_INVESTMENT_CENTS = MIN_INVESTMENT_TO_HEDGE * 100
+        
         try:
-            print(f"[{self._timestamp()}] Scanning Kalshi Portfolio...")
+            log.info("Scanning Kalshi Portfolio...")
             
             # 1. Get real positions from Kalshi
             # Use count_filter to only get positions with non-zero position values
@@ -89,244 +223,707 @@ class KalshiBot:
             portfolio_items = response.positions
             
             if not portfolio_items:
-                print(f"[{self._timestamp()}] No positions found in portfolio")
+                log.info("No positions found in portfolio")
                 return []
             
+            # Calculate how much you have invested (Quantity * Average Price) for the whole portfolio at once
+            # Note: Kalshi prices are in cents (e.g., 50 = $0.50); round once so the rest is integer math
+            tickers = np.array([p.ticker for p in portfolio_items], dtype=object)
+            quantities = np.array([p.position for p in portfolio_items], dtype=np.int64)
+            avg_prices = np.array([p.avg_price for p in portfolio_items], dtype=float)
+            entry_cents = np.rint(avg_prices).astype(np.int64)
+            
+            fractional = entry_cents != avg_prices
+            for ticker, avg_price, rounded in zip(tickers[fractional], avg_prices[fractional], entry_cents[fractional]):
+                log.warning("%s avg_price %s is not a whole number of cents, rounded to %s", ticker, avg_price, rounded)
+            
+            invested_cents = quantities * entry_cents
+            
+            # 2. The Filter: Is this bet big enough to care about?
+            mask = invested_cents >= MIN_INVESTMENT_CENTS
+            
             valid_positions = []
             
-            for p in portfolio_items:
-                # Calculate how much you have invested (Quantity * Average Price)
-                # Note: Kalshi prices are usually in cents (e.g., 50 = $0.50)
-                # If price is < 1, we assume it's dollars already
-                
-                price_in_cents = p.avg_price
-                if p.avg_price < 1: # Handle edge case if API returns dollars (e.g. 0.50)
-                    price_in_cents = p.avg_price * 100
-                    
-                invested_value_dollars = (p.position * price_in_cents) / 100
+            for ticker, entry, quantity, invested in zip(
+                tickers[mask], entry_cents[mask], quantities[mask], invested_cents[mask]
+            ):
+                log.info(" -> Tracking %s ($%.2f invested)", ticker, invested / 100)
                 
-                # 2. The Filter: Is this bet big enough to care about?
-                if invested_value_dollars >= MIN_INVESTMENT_TO_HEDGE:
-                    print(f" -> Tracking {p.ticker} (${invested_value_dollars:.2f} invested)")
-                    
-                    # Convert to the format our bot expects
-                    valid_positions.append({
-                        "ticker": p.ticker,
-                        "entry_price": p.avg_price,
-                        "quantity": p.position,
-                        "status": "OPEN",
-                        "id": None  # No database ID in auto-pilot mode
-                    })
-                else:
-                    print(f" -> Ignoring {p.ticker} (Only ${invested_value_dollars:.2f} invested)")
+                # Convert to the format our bot expects
+                valid_positions.append({
+                    "ticker": ticker,
+                    "entry_cents": int(entry),
+                    "quantity": int(quantity),
+                    "status": "OPEN",
+                    "id": None  # No database ID in auto-pilot mode
+                })
+            
+            ignored = int((~mask).sum())
+            if ignored:
+                log.info(" -> Ignoring %s positions under $%s invested", ignored, MIN_INVESTMENT_TO_HEDGE)
 
             if not valid_positions:
-                print(f"[{self._timestamp()}] No positions found above ${MIN_INVESTMENT_TO_HEDGE} threshold.")
+                log.info("No positions found above $%s threshold.", MIN_INVESTMENT_TO_HEDGE)
                 
             return valid_positions
 
         except Exception as e:
-            print(f"Error fetching portfolio: {e}")
+            log.error("Error fetching portfolio: %s", e)
             return []
     
-    def get_current_price(self, ticker: str) -> Optional[float]:
-        """Fetch current yes_bid price from Kalshi API"""
+    def _cache_price(self, ticker: str, price: int):
+        """Record a fresh yes_bid quote in the price cache"""
+        self._price_cache[ticker] = (price, time.monotonic())
+    
+    def _cache_lookup(self, ticker: str) -> Tuple[Optional[int], bool]:
+        """Return (cached price, needs background refresh); price is None when unusable"""
+        cached = self._price_cache.get(ticker)
+        if cached is None:
+            return None, False
+        
+        price, fetched_at = cached
+        age = time.monotonic() - fetched_at
+        
+        if age < PRICE_CACHE_MAX_AGE_SECONDS:
+            return price, False
+        if age < PRICE_CACHE_MAX_AGE_SECONDS + PRICE_CACHE_SWR_SECONDS:
+            return price, True
+        return None, False
+    
+    def _schedule_refresh(self, tickers: Iterable[str]):
+        """Refresh stale cached prices in the background with one bulk request"""
+        tickers = [t for t in tickers if t not in self._refreshing]
+        if not tickers:
+            return
+        
+        self._refreshing.update(tickers)
+        
+        async def refresh():
+            try:
+                await self._request_prices(tickers)
+            finally:
+                self._refreshing.difference_update(tickers)
+        
+        task = asyncio.create_task(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+    
+    async def fetch_prices_bulk(self, tickers: List[str]) -> Dict[str, int]:
+        """Return yes_bid prices in cents for all tickers, fetching uncached ones in a single markets call"""
+        prices = {}
+        stale = []
+        missing = []
+        
+        for ticker in tickers:
+            price, needs_refresh = self._cache_lookup(ticker)
+            if price is None:
+                missing.append(ticker)
+                continue
+            
+            prices[ticker] = price
+            if needs_refresh:
+                stale.append(ticker)
+        
+        if stale:
+            self._schedule_refresh(stale)
+        
+        if missing:
+            prices.update(await self._request_prices(missing))
+        
+        return prices
+    
+    async def _request_prices(self, tickers: List[str]) -> Dict[str, int]:
+        """Fetch yes_bid prices in cents for all tickers in a single Kalshi markets call"""
+        if not tickers:
+            return {}
+        
         try:
-            # Get market information
-            market = self.kalshi_api.get_market(ticker=ticker)
+            # One request for the whole portfolio instead of one get_market per ticker
+            data = await self._kalshi_request(
+                "GET", "/markets", params={'tickers': ",".join(tickers), 'limit': len(tickers)}
+            )
             
-            if not market or not hasattr(market, 'market'):
-                print(f"[{self._timestamp()}] WARNING: No market data for {ticker}")
-                return None
+            # Kalshi prices are in cents; a market without a numeric yes_bid only loses its own ticker
+            prices = {}
+            for m in data.get('markets', []):
+                yes_bid = as_int(m.get('yes_bid'))
+                if yes_bid is not None:
+                    prices[m['ticker']] = yes_bid
             
-            # Extract yes_bid price (the price we can sell at)
-            yes_bid = market.market.yes_bid / 100.0  # Kalshi prices are in cents
-            print(f"[{self._timestamp()}] {ticker} current yes_bid: ${yes_bid:.2f}")
-            return yes_bid
+            for ticker in tickers:
+                if ticker in prices:
+                    self._cache_price(ticker, prices[ticker])
+                    log.info("%s current yes_bid: $%.2f", ticker, prices[ticker] / 100)
+                else:
+                    log.warning("No market data for %s", ticker)
+            
+            return prices
             
         except Exception as e:
-            print(f"[{self._timestamp()}] ERROR fetching price for {ticker}: {str(e)}")
-            return None
+            log.error("ERROR fetching prices for %s tickers: %s", len(tickers), e)
+            return {}
     
-    def calculate_hedge_quantity(self, entry_price: float, quantity: int, current_price: float) -> int:
-        """Calculate number of contracts to sell to recover initial capital"""
-        initial_capital = entry_price * quantity
-        contracts_to_sell = floor(initial_capital / current_price)
+    def calculate_hedge_quantity(self, entry_cents, quantity, current_cents):
+        """
+        Calculate number of contracts to sell to recover initial capital.
+        Prices are integer cents, so the division is exact floor division.
+        Accepts scalars or NumPy arrays, so a whole portfolio can be sized in one call.
+        """
+        initial_capital_cents = np.multiply(entry_cents, quantity)
+        contracts_to_sell = initial_capital_cents // current_cents
         
         # Safety bounds
-        contracts_to_sell = max(0, min(contracts_to_sell, quantity - 1))
-        
-        print(f"[{self._timestamp()}] Hedge calculation: Initial capital=${initial_capital:.2f}, "
-              f"Selling {contracts_to_sell}/{quantity} contracts")
-        
-        return contracts_to_sell
+        return np.clip(contracts_to_sell, 0, np.subtract(quantity, 1))
+    
+    def hedge_triggered(self, entry_cents, current_cents):
+        """
+        The 50% gain trigger, exactly in integer cents.
+        Accepts scalars or NumPy arrays, like calculate_hedge_quantity.
+        """
+        return 2 * current_cents >= 3 * entry_cents
     
-    def execute_sell_order(self, ticker: str, quantity: int, price: float) -> bool:
+    async def execute_sell_order(self, ticker: str, quantity: int, price_cents: int) -> bool:
         """Place a limit sell order on Kalshi"""
         try:
-            # Convert price back to cents for Kalshi API
-            price_cents = int(price * 100)
-            
-            print(f"[{self._timestamp()}] Placing sell order: {quantity} contracts of {ticker} at ${price:.2f}")
+            log.info("Placing sell order: %s contracts of %s at $%.2f", quantity, ticker, price_cents / 100)
             
             # Create sell order using Kalshi API
-            order = self.kalshi_api.create_order(
-                ticker=ticker,
-                client_order_id=f"hedge_{ticker}_{int(time.time())}",
-                side="sell",
-                action="sell",
-                count=quantity,
-                type="limit",
-                yes_price=price_cents
-            )
+            data = await self._kalshi_request("POST", "/portfolio/orders", body={
+                'ticker': ticker,
+                'client_order_id': f"hedge_{ticker}_{next(self._order_seq)}",
+                'side': "yes",
+                'action': "sell",
+                'count': quantity,
+                'type': "limit",
+                'yes_price': price_cents
+            })
+            order = data.get('order')
             
-            if order and hasattr(order, 'order'):
-                order_id = order.order.order_id
-                print(f"[{self._timestamp()}] ✅ Order placed successfully. Order ID: {order_id}")
+            if order:
+                order_id = order['order_id']
+                self._hedge_orders[order_id] = [ticker, quantity]
+                log.info("✅ Order placed successfully. Order ID: %s", order_id)
                 return True
             else:
-                print(f"[{self._timestamp()}] ❌ Order placement failed - no order returned")
+                log.error("❌ Order placement failed - no order returned")
                 return False
                 
         except Exception as e:
-            print(f"[{self._timestamp()}] ERROR executing sell order for {ticker}: {str(e)}")
-            self.send_discord_alert(f"⚠️ Order Execution Error: {ticker} - {str(e)}")
+            log.error("ERROR executing sell order for %s: %s", ticker, e)
+            await self.send_discord_alert(f"⚠️ Order Execution Error: {ticker} - {str(e)}")
             return False
     
-    def update_position_status(self, position_id: int, remaining_quantity: int):
-        """Update position in Supabase after hedge execution"""
+    def update_position_status(self, position: Dict, remaining_quantity: int):
+        """Queue a position update for the batched Supabase write after hedge execution"""
+        # Skip database update if no position ID (auto-pilot mode)
+        if position.get('id') is None:
+            log.info("Skipping database update (auto-pilot mode)")
+            return
+        
+        # upsert() runs the INSERT half, including its NOT NULL checks, before resolving the id
+        # conflict, so every row must carry every required column of the positions table.
+        # Assumed schema: positions(id, ticker, entry_price, quantity, status), with entry_price in
+        # the same cents as Kalshi's avg_price. A position only has an id if it was loaded from that
+        # table, so the conflict always resolves to an update and no new rows are created.
+        self._pending_db_updates.append({
+            'id': position['id'],
+            'ticker': position['ticker'],
+            'entry_price': int(position['entry_cents']),
+            'status': 'HEDGED',
+            'quantity': remaining_quantity
+        })
+    
+    async def flush_position_updates(self):
+        """Write all queued position updates to Supabase in a single upsert"""
+        if not self._pending_db_updates:
+            return
+        
+        updates, self._pending_db_updates = self._pending_db_updates, []
+        position_ids = ', '.join(str(u['id']) for u in updates)
+        
         try:
-            # Skip database update if no position ID (auto-pilot mode)
-            if position_id is None:
-                print(f"[{self._timestamp()}] Skipping database update (auto-pilot mode)")
-                return
-                
-            update_data = {
-                'status': 'HEDGED',
-                'quantity': remaining_quantity
-            }
-            
-            self.supabase.table('positions').update(update_data).eq('id', position_id).execute()
-            print(f"[{self._timestamp()}] Updated position {position_id} in database")
+            query = self.supabase.table('positions').upsert(updates, on_conflict='id')
+            await asyncio.to_thread(query.execute)
+            log.info("Updated positions %s in database", position_ids)
             
         except Exception as e:
-            print(f"[{self._timestamp()}] ERROR updating position {position_id}: {str(e)}")
-            self.send_discord_alert(f"⚠️ Database Update Error: Position {position_id} - {str(e)}")
+            log.error("ERROR updating positions %s: %s", position_ids, e)
+            await self.send_discord_alert(f"⚠️ Database Update Error: Positions {position_ids} - {str(e)}")
     
-    def send_discord_alert(self, message: str):
-        """Send notification to Discord webhook"""
-        try:
-            payload = {
-                'content': message,
-                'username': 'Kalshi Trading Bot'
-            }
-            
-            response = requests.post(self.discord_url, json=payload, timeout=10)
+    async def send_discord_alert(self, message: str, flush: bool = False):
+        """Buffer a notification for Discord; posted by _flush_alerts or immediately with flush=True"""
+        self._alert_buffer.append(message)
+        
+        if flush:
+            await self._flush_alerts()
+    
+    def _chunk_alerts(self, messages: List[str]) -> List[str]:
+        """Join buffered alerts into the fewest Discord-sized messages"""
+        chunks = []
+        current = ""
+        
+        for message in messages:
+            # A single oversized alert is split on the hard limit
+            while len(message) > DISCORD_MAX_CONTENT:
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(message[:DISCORD_MAX_CONTENT])
+                message = message[DISCORD_MAX_CONTENT:]
             
-            if response.status_code == 204:
-                print(f"[{self._timestamp()}] Discord notification sent")
+            candidate = f"{current}{DISCORD_ALERT_SEPARATOR}{message}" if current else message
+            if len(candidate) > DISCORD_MAX_CONTENT:
+                chunks.append(current)
+                current = message
             else:
-                print(f"[{self._timestamp()}] Discord notification failed: {response.status_code}")
+                current = candidate
+        
+        if current:
+            chunks.append(current)
+        
+        return chunks
+    
+    async def _flush_alerts(self):
+        """Post all buffered alerts to the Discord webhook"""
+        if not self._alert_buffer:
+            return
+        
+        messages, self._alert_buffer = self._alert_buffer, []
+        
+        for content in self._chunk_alerts(messages):
+            try:
+                payload = {
+                    'content': content,
+                    'username': 'Kalshi Trading Bot'
+                }
                 
-        except Exception as e:
-            print(f"[{self._timestamp()}] ERROR sending Discord alert: {str(e)}")
+                response = await asyncio.to_thread(self._http.post, self.discord_url, json=payload, timeout=10)
+                
+                if response.status_code == 204:
+                    log.info("Discord notification sent")
+                else:
+                    log.warning("Discord notification failed: %s", response.status_code)
+                    
+            except Exception as e:
+                log.error("ERROR sending Discord alert: %s", e)
     
-    def process_position(self, position: Dict):
-        """Process a single position for potential hedge execution"""
+    async def process_position(self, position: Dict, current_cents: Optional[int]) -> bool:
+        """Process a single position for potential hedge execution. Returns True if hedged"""
         ticker = position['ticker']
-        entry_price = float(position['entry_price'])
+        entry_cents = int(position['entry_cents'])
         quantity = int(position['quantity'])
-        position_id = position.get('id')  # Use get() to handle None safely
         
-        print(f"\n[{self._timestamp()}] Processing {ticker}: Entry=${entry_price:.2f}, Qty={quantity}")
+        log.info("Processing %s: Entry=$%.2f, Qty=%s", ticker, entry_cents / 100, quantity)
         
-        # Fetch current market price
-        current_price = self.get_current_price(ticker)
-        
-        if current_price is None:
-            print(f"[{self._timestamp()}] Skipping {ticker} - no price data available")
-            return
+        if current_cents is None:
+            log.info("Skipping %s - no price data available", ticker)
+            return False
         
         # Calculate gain percentage
-        percent_gain = (current_price - entry_price) / entry_price
-        print(f"[{self._timestamp()}] {ticker} gain: {percent_gain*100:.2f}%")
+        percent_gain = (current_cents - entry_cents) / entry_cents
+        log.info("%s gain: %.2f%%", ticker, percent_gain*100)
         
         # Check if trigger condition is met (50% gain)
-        if percent_gain >= 0.50:
-            print(f"[{self._timestamp()}] 🎯 TRIGGER MET for {ticker}! Executing hedge...")
-            
-            # Calculate contracts to sell
-            contracts_to_sell = self.calculate_hedge_quantity(entry_price, quantity, current_price)
-            
-            if contracts_to_sell <= 0:
-                print(f"[{self._timestamp()}] ⚠️ Invalid hedge quantity calculated, skipping")
-                return
-            
-            # Execute sell order
-            success = self.execute_sell_order(ticker, contracts_to_sell, current_price)
-            
-            if success:
-                # Calculate remaining contracts
-                remaining_quantity = quantity - contracts_to_sell
-                capital_recovered = contracts_to_sell * current_price
-                
-                # Update database
-                self.update_position_status(position_id, remaining_quantity)
-                
-                # Send success notification
-                message = (
-                    f"🟢 **HEDGE EXECUTED**\n"
-                    f"📊 Ticker: {ticker}\n"
-                    f"💰 Sold {contracts_to_sell} contracts at ${current_price:.2f}\n"
-                    f"💵 Capital recovered: ${capital_recovered:.2f}\n"
-                    f"🎁 Remaining {remaining_quantity} contracts are free profit!\n"
-                    f"📈 Gain: {percent_gain*100:.1f}%"
-                )
-                self.send_discord_alert(message)
-            else:
-                print(f"[{self._timestamp()}] ❌ Hedge execution failed for {ticker}")
-        else:
-            print(f"[{self._timestamp()}] {ticker} below 50% threshold, no action taken")
+        if self.hedge_triggered(entry_cents, current_cents):
+            contracts_to_sell = int(self.calculate_hedge_quantity(entry_cents, quantity, current_cents))
+            return await self.execute_hedge(position, current_cents, percent_gain, contracts_to_sell)
+        
+        log.info("%s below 50%% threshold, no action taken", ticker)
+        return False
+    
+    def evaluate_triggers(self, positions: List[Dict], prices: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluate the 50% gain trigger for the whole portfolio in one vector pass.
+        Returns (percent_gain, triggered); positions without a price never trigger.
+        """
+        entry = np.array([p['entry_cents'] for p in positions])
+        current = np.array([prices.get(p['ticker'], -1) for p in positions])
+        has_price = current >= 0
+        
+        percent_gain = np.where(has_price, (current - entry) / entry, np.nan)
+        triggered = has_price & self.hedge_triggered(entry, current)
+        
+        return percent_gain, triggered
+    
+    async def execute_hedge(self, position: Dict, current_cents: int, percent_gain: float,
+                            contracts_to_sell: int) -> bool:
+        """Place and record the hedge sized by calculate_hedge_quantity for a triggered position. Returns True if hedged"""
+        ticker = position['ticker']
+        entry_cents = int(position['entry_cents'])
+        quantity = int(position['quantity'])
+        
+        log.info("🎯 TRIGGER MET for %s (gain %.2f%%)! Executing hedge...", ticker, percent_gain*100)
+        log.info("Hedge calculation: Initial capital=$%.2f, Selling %s/%s contracts",
+                 entry_cents * quantity / 100, contracts_to_sell, quantity)
+        
+        if contracts_to_sell <= 0:
+            log.warning("⚠️ Invalid hedge quantity calculated, skipping")
+            return False
+        
+        # Execute sell order
+        success = await self.execute_sell_order(ticker, contracts_to_sell, current_cents)
+        
+        if not success:
+            log.error("❌ Hedge execution failed for %s", ticker)
+            return False
+        
+        # Calculate remaining contracts
+        remaining_quantity = quantity - contracts_to_sell
+        capital_recovered_cents = contracts_to_sell * current_cents
+        
+        # Queue database update (written in one batch by flush_position_updates). The order is
+        # already live, so a bookkeeping failure is reported on its own, never as a failed hedge
+        try:
+            self.update_position_status(position, remaining_quantity)
+        except Exception as e:
+            log.error("ERROR queueing database update for %s: %s", ticker, e)
+            await self.send_discord_alert(f"⚠️ Database Update Error: {ticker} - {str(e)}")
+        
+        # Send success notification
+        message = (
+            f"🟢 **HEDGE EXECUTED**\n"
+            f"📊 Ticker: {ticker}\n"
+            f"💰 Sold {contracts_to_sell} contracts at ${current_cents / 100:.2f}\n"
+            f"💵 Capital recovered: ${capital_recovered_cents / 100:.2f}\n"
+            f"🎁 Remaining {remaining_quantity} contracts are free profit!\n"
+            f"📈 Gain: {percent_gain*100:.1f}%"
+        )
+        await self.send_discord_alert(message)
+        return True
     
-    def run(self):
+    async def run(self):
         """Main bot execution loop"""
-        print(f"\n{'='*60}")
-        print(f"[{self._timestamp()}] Starting Kalshi Risk-Neutralization Bot")
-        print(f"{'='*60}\n")
+        log.info("=" * 60)
+        log.info("Starting Kalshi Risk-Neutralization Bot")
+        log.info("=" * 60)
         
         try:
             # Fetch all open positions
-            positions = self.fetch_open_positions()
+            positions = await asyncio.to_thread(self.fetch_open_positions)
             
             if not positions:
-                print(f"[{self._timestamp()}] No open positions to process")
+                log.info("No open positions to process")
                 return
             
-            # Process each position
-            for position in positions:
-                try:
-                    self.process_position(position)
-                except Exception as e:
+            # Fetch current market prices for every position in one call
+            prices = await self.fetch_prices_bulk([p['ticker'] for p in positions])
+            
+            # Decide the trigger for every position at once; only triggered ones reach order placement
+            percent_gain, triggered = self.evaluate_triggers(positions, prices)
+            
+            no_price = [p['ticker'] for p in positions if p['ticker'] not in prices]
+            if no_price:
+                log.info("Skipping %s - no price data available", ', '.join(no_price))
+            
+            log.info("%s/%s positions at or above 50%% threshold", int(triggered.sum()), len(positions))
+            
+            # Highest gain first, so the strongest hedges get socket time first
+            hedge_indices = np.flatnonzero(triggered)
+            hedge_indices = hedge_indices[np.argsort(-percent_gain[hedge_indices], kind='stable')]
+            hedge_positions = [positions[i] for i in hedge_indices]
+            
+            # Size every triggered hedge in one vector call
+            contracts = self.calculate_hedge_quantity(
+                np.array([p['entry_cents'] for p in hedge_positions], dtype=np.int64),
+                np.array([p['quantity'] for p in hedge_positions], dtype=np.int64),
+                np.array([prices[p['ticker']] for p in hedge_positions], dtype=np.int64)
+            )
+            
+            # Hedge triggered positions concurrently, bounded by the rate-limit semaphore.
+            # Waiters acquire it in FIFO order, so orders are submitted in ranked order
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+            
+            async def hedge_limited(i: int, contracts_to_sell: int):
+                async with semaphore:
+                    position = positions[i]
+                    await self.execute_hedge(
+                        position, prices[position['ticker']], float(percent_gain[i]), contracts_to_sell
+                    )
+            
+            results = await asyncio.gather(
+                *[hedge_limited(i, int(n)) for i, n in zip(hedge_indices, contracts)], return_exceptions=True
+            )
+            
+            for position, result in zip(hedge_positions, results):
+                if isinstance(result, Exception):
                     ticker = position.get('ticker', 'UNKNOWN')
-                    print(f"[{self._timestamp()}] ERROR processing {ticker}: {str(e)}")
-                    self.send_discord_alert(f"⚠️ Error processing {ticker}: {str(e)}")
+                    log.error("ERROR processing %s: %s", ticker, result)
+                    await self.send_discord_alert(f"⚠️ Error processing {ticker}: {str(result)}")
             
-            print(f"\n[{self._timestamp()}] Bot execution completed successfully")
+            await self.flush_position_updates()
+            await self._flush_alerts()
+            
+            log.info("Bot execution completed successfully")
             
         except Exception as e:
             error_msg = f"Critical error in bot execution: {str(e)}"
-            print(f"[{self._timestamp()}] {error_msg}")
-            self.send_discord_alert(f"🚨 **CRITICAL ERROR**: {error_msg}")
+            log.error("%s", error_msg)
+            await self.flush_position_updates()
+            await self.send_discord_alert(f"🚨 **CRITICAL ERROR**: {error_msg}", flush=True)
             sys.exit(1)
+        finally:
+            await self._kalshi_http.aclose()
+    
+    async def stream_and_hedge(self):
+        """
+        STREAMING MODE:
+        Subscribes to Kalshi's ticker channel for every open position and
+        re-evaluates the hedge trigger for a ticker each time its yes_bid changes.
+        Runs until every tracked position has been hedged.
+        """
+        # --- SETTINGS ---
+        INITIAL_BACKOFF_SECONDS = 1
+        MAX_BACKOFF_SECONDS = 60
+        # How long to keep the socket open for outstanding fills once every position is hedged
+        FILL_WAIT_SECONDS = 60
+        # ----------------
+        
+        log.info("=" * 60)
+        log.info("Starting Kalshi Risk-Neutralization Bot (streaming)")
+        log.info("=" * 60)
+        
+        try:
+            positions = await asyncio.to_thread(self.fetch_open_positions)
+            self._stream_positions = {p['ticker']: p for p in positions}
+            
+            if not self._stream_positions:
+                log.info("No open positions to stream")
+                return
+            
+            loop = asyncio.get_running_loop()
+            backoff = INITIAL_BACKOFF_SECONDS
+            fill_deadline = None
+            
+            while self._stream_active():
+                try:
+                    headers = self._auth_headers("GET", KALSHI_WS_PATH)
+                    async with websockets.connect(KALSHI_WS_URL, additional_headers=headers) as ws:
+                        backoff = INITIAL_BACKOFF_SECONDS
+                        
+                        # Subscribe to fills before any hedge is placed, so none of their fills are missed
+                        await ws.send(json.dumps({
+                            'id': 1,
+                            'cmd': 'subscribe',
+                            'params': {'channels': ['fill']}
+                        }))
+                        
+                        if self._stream_positions:
+                            await ws.send(json.dumps({
+                                'id': 2,
+                                'cmd': 'subscribe',
+                                'params': {
+                                    'channels': ['ticker'],
+                                    'market_tickers': list(self._stream_positions)
+                                }
+                            }))
+                            log.info("Subscribed to %s tickers", len(self._stream_positions))
+                        
+                        # Seed prices on every (re)connect; the ticker channel only pushes changes
+                        if self._stream_positions:
+                            await self._seed_prices()
+                        
+                        while self._stream_active():
+                            timeout = None
+                            if not self._stream_positions:
+                                # Everything is hedged; only wait a bounded time for the remaining fills
+                                if fill_deadline is None:
+                                    fill_deadline = loop.time() + FILL_WAIT_SECONDS
+                                timeout = max(0.0, fill_deadline - loop.time())
+                            
+                            try:
+                                raw = await asyncio.wait_for(ws.recv(), timeout)
+                            except asyncio.TimeoutError:
+                                log.warning("Stopped waiting for fills on orders %s", ', '.join(self._hedge_orders))
+                                self._hedge_orders.clear()
+                                break
+                            
+                            try:
+                                message = json.loads(raw)
+                            except ValueError:
+                                message = None
+                            if not isinstance(message, dict):
+                                log.warning("Ignoring malformed WebSocket frame: %.200s", raw)
+                                continue
+                            
+                            await self._handle_stream_message(message)
+                            await self._flush_alerts()
+                            flush_logs()
+                            
+                except (websockets.exceptions.WebSocketException, OSError) as e:
+                    log.warning("WebSocket error: %s", e)
+                
+                if self._hedge_orders and not self._stream_positions and fill_deadline is not None \
+                        and loop.time() >= fill_deadline:
+                    log.warning("Stopped waiting for fills on orders %s", ', '.join(self._hedge_orders))
+                    self._hedge_orders.clear()
+                
+                if not self._stream_active():
+                    break
+                
+                # Reconnect with exponential backoff
+                log.info("Reconnecting in %ss...", backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+            
+            log.info("All tracked positions hedged or given up and fills settled, stream closed")
+            
+        except Exception as e:
+            error_msg = f"Critical error in streaming mode: {str(e)}"
+            log.error("%s", error_msg)
+            await self.flush_position_updates()
+            await self.send_discord_alert(f"🚨 **CRITICAL ERROR**: {error_msg}", flush=True)
+            sys.exit(1)
+        finally:
+            await self._kalshi_http.aclose()
+    
+    def _stream_active(self) -> bool:
+        """Streaming continues while positions await a hedge or hedge orders await their fills"""
+        return bool(self._stream_positions or self._hedge_orders)
+    
+    async def _seed_prices(self):
+        """
+        Take a price snapshot for every streamed position and evaluate those whose price moved,
+        highest gain first. The snapshot always goes to REST and bypasses the price cache: the
+        ticker channel only pushes changes, so after a reconnect every cached quote may have
+        missed a move made while the socket was down.
+        """
+        snapshot = await self._request_prices(list(self._stream_positions))
+        changed = [t for t in self._stream_positions if t in snapshot and snapshot[t] != self.prices.get(t)]
+        self.prices.update(snapshot)
+        
+        percent_gain, _ = self.evaluate_triggers([self._stream_positions[t] for t in changed], self.prices)
+        for i in np.argsort(-np.nan_to_num(percent_gain, nan=-np.inf), kind='stable'):
+            await self._evaluate_ticker(changed[i])
+        await self._flush_alerts()
+        flush_logs()
+    
+    async def _handle_stream_message(self, message: Dict):
+        """Apply a ticker update from the WebSocket and re-check only that ticker"""
+        msg_type = message.get('type')
+        msg = message.get('msg')
+        
+        if msg_type == 'error':
+            log.warning("WebSocket error message: %s", msg)
+            return
+        
+        if not isinstance(msg, dict):
+            return
+        
+        if msg_type == 'fill':
+            self._handle_fill(msg)
+            return
+        
+        if msg_type != 'ticker':
+            return
+        
+        ticker = msg.get('market_ticker')
+        
+        if not isinstance(ticker, str) or ticker not in self._stream_positions or msg.get('yes_bid') is None:
+            return
+        
+        # Kalshi prices are in cents; same check as the REST snapshot
+        yes_bid = as_int(msg['yes_bid'])
+        if yes_bid is None:
+            log.warning("Ignoring non-numeric yes_bid %r for %s", msg['yes_bid'], ticker)
+            return
+        
+        if self.prices.get(ticker) == yes_bid:
+            return
+        
+        self.prices[ticker] = yes_bid
+        await self._evaluate_ticker(ticker)
+    
+    def _handle_fill(self, msg: Dict):
+        """Log a pushed fill for one of the hedge orders placed by this bot, retiring it once fully filled"""
+        order_id = msg.get('order_id')
+        order = self._hedge_orders.get(order_id)
+        if order is None:
+            return
+        
+        ticker = order[0]
+        count = as_int(msg.get('count'))
+        if count is None:
+            log.warning("Ignoring fill for %s with non-numeric count %r", order_id, msg.get('count'))
+            return
+        
+        log.info("📥 Fill for %s: %s contracts at $%.2f (Order ID: %s)",
+                 ticker, count, (as_int(msg.get('yes_price')) or 0) / 100, order_id)
+        
+        order[1] -= count
+        if order[1] <= 0:
+            del self._hedge_orders[order_id]
+    
+    async def _evaluate_ticker(self, ticker: str):
+        """
+        Run the hedge trigger for one streamed ticker, dropping it once hedged.
+        A failed hedge backs the ticker off before its next attempt, and after MAX_HEDGE_ATTEMPTS
+        failures it is dropped, so a persistent rejection cannot alert on every price push.
+        """
+        failures, retry_at = self._hedge_failures.get(ticker, (0, 0.0))
+        if time.monotonic() < retry_at:
+            return
+        
+        try:
+            position = self._stream_positions[ticker]
+            current_cents = self.prices.get(ticker)
+            
+            if await self.process_position(position, current_cents):
+                del self._stream_positions[ticker]
+                self._hedge_failures.pop(ticker, None)
+                await self.flush_position_updates()
+                return
+            
+            if current_cents is None or not self.hedge_triggered(int(position['entry_cents']), current_cents):
+                return
+        except Exception as e:
+            log.error("ERROR processing %s: %s", ticker, e)
+            await self.send_discord_alert(f"⚠️ Error processing {ticker}: {str(e)}")
+        
+        # The trigger was met but no hedge went through
+        failures += 1
+        if failures >= MAX_HEDGE_ATTEMPTS:
+            log.error("Giving up on %s after %s failed hedge attempts", ticker, failures)
+            await self.send_discord_alert(f"🚨 Giving up on hedging {ticker} after {failures} failed attempts")
+            self._stream_positions.pop(ticker, None)
+            self._hedge_failures.pop(ticker, None)
+            return
+        
+        delay = HEDGE_RETRY_BACKOFF_SECONDS * 2 ** (failures - 1)
+        self._hedge_failures[ticker] = (failures, time.monotonic() + delay)
+        log.warning("Hedge for %s failed (%s/%s), retrying in %ss", ticker, failures, MAX_HEDGE_ATTEMPTS, delay)
+
+
+def configure_logging():
+    """Log the bot's INFO and above to stdout, buffering writes until 100 records or an ERROR"""
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter('[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+    
+    buffered_handler = logging.handlers.MemoryHandler(
+        capacity=100, flushLevel=logging.ERROR, target=stream_handler
+    )
+    # Only the bot logs at INFO; httpx and websockets stay at the root WARNING level
+    logging.basicConfig(handlers=[buffered_handler])
+    log.setLevel(logging.INFO)
+
+
+def flush_logs():
+    """Write buffered log records out now, so a long-lived stream never holds them back"""
+    for handler in logging.getLogger().handlers:
+        handler.flush()
 
 
 def main():
-    """Entry point for the bot"""
+    """Entry point for the bot. Pass --stream to run in WebSocket streaming mode"""
+    configure_logging()
+    
     try:
         bot = KalshiBot()
-        bot.run()
+        if '--stream' in sys.argv[1:]:
+            asyncio.run(bot.stream_and_hedge())
+        else:
+            asyncio.run(bot.run())
     except Exception as e:
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Fatal error: {str(e)}")
+        log.error("Fatal error: %s", e)
         sys.exit(1)
 
 
@@ -0,0 +1,201 @@
+"""
+Profiling harness for the Kalshi bot
+Runs one full bot.run() against fake Kalshi, Supabase and Discord backends that inject
+configurable network latency, so the profile shows where wall time actually goes.
+
+Usage:
+    python scripts/profile_run.py                      # cProfile, writes profile_run.prof
+    python scripts/profile_run.py --positions 200 --latency 0.1
+    python scripts/profile_run.py --html               # pyinstrument flame graph (pip install pyinstrument)
+
+Inspect a .prof dump with: python -m pstats profile_run.prof  (or snakeviz profile_run.prof)
+"""
+
+import argparse
+import asyncio
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import bot  # noqa: E402
+
+
+def build_portfolio(count: int) -> list:
+    """Fake Kalshi positions: every third one is up 60% and will trigger a hedge"""
+    return [
+        SimpleNamespace(ticker=f"PROFILE-{i:04d}", position=50, avg_price=40)
+        for i in range(count)
+    ]
+
+
+def market_price(ticker: str) -> int:
+    """Deterministic yes_bid in cents for a fake ticker"""
+    return 64 if int(ticker.rsplit('-', 1)[1]) % 3 == 0 else 45
+
+
+class FakeKalshiClient:
+    """Stands in for kalshi_python.KalshiClient; blocking calls sleep like a real round-trip"""
+
+    def __init__(self, portfolio: list, latency: float):
+        self.portfolio = portfolio
+        self.latency = latency
+
+    def get_positions(self, **kwargs):
+        time.sleep(self.latency)
+        return SimpleNamespace(positions=self.portfolio)
+
+
+class FakeSupabase:
+    """Stands in for the Supabase client; every execute() sleeps like a PostgREST call"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.rows = []
+        self.upserted = 0
+
+    def table(self, name: str):
+        return self
+
+    def upsert(self, rows, **kwargs):
+        self.rows = rows
+        return self
+
+    def execute(self):
+        time.sleep(self.latency)
+        self.upserted += len(self.rows)
+        return SimpleNamespace(data=self.rows)
+
+
+class FakeDiscordSession:
+    """Stands in for the requests.Session used for Discord webhooks"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def post(self, *args, **kwargs):
+        time.sleep(self.latency)
+        return SimpleNamespace(status_code=204)
+
+
+def kalshi_transport(latency: float) -> httpx.MockTransport:
+    """httpx transport answering the bot's raw Kalshi REST calls after an async delay"""
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        path = request.url.path.removeprefix(bot.KALSHI_API_PATH)
+
+        if path == "/markets":
+            tickers = request.url.params['tickers'].split(',')
+            return httpx.Response(200, json={
+                'markets': [{'ticker': t, 'yes_bid': market_price(t)} for t in tickers]
+            })
+        if path == "/portfolio/orders":
+            return httpx.Response(201, json={'order': {'order_id': f"order-{time.monotonic_ns()}"}})
+
+        return httpx.Response(404, json={'error': path})
+
+    return httpx.MockTransport(handler)
+
+
+def build_bot(positions: int, latency: float) -> bot.KalshiBot:
+    """Create a KalshiBot wired to the fake backends"""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode()
+
+    env = {
+        'KALSHI_KEY': 'profile-key',
+        'KALSHI_SECRET': pem,
+        'SUPABASE_URL': 'https://profile.supabase.co',
+        'SUPABASE_KEY': 'profile-key',
+        'DISCORD_URL': 'https://discord.com/api/webhooks/profile'
+    }
+    fake_kalshi = FakeKalshiClient(build_portfolio(positions), latency)
+    real_async_client = httpx.AsyncClient
+
+    # Route the bot's own AsyncClient through the fake transport so run() still owns and closes it
+    def fake_async_client(**kwargs):
+        return real_async_client(transport=kalshi_transport(latency), **kwargs)
+
+    with mock.patch.dict(os.environ, env), \
+            mock.patch.object(bot, 'Configuration', lambda **kwargs: SimpleNamespace(**kwargs)), \
+            mock.patch.object(bot, 'KalshiClient', lambda configuration: fake_kalshi), \
+            mock.patch.object(bot.httpx, 'AsyncClient', fake_async_client):
+        kalshi_bot = bot.KalshiBot()
+
+    kalshi_bot._http = FakeDiscordSession(latency)
+    kalshi_bot._supabase = FakeSupabase(latency)
+
+    # Give every other position a database row, as if it were tracked in Supabase, so hedges
+    # on those positions go through the batched upsert instead of the auto-pilot skip
+    fetch_open_positions = kalshi_bot.fetch_open_positions
+
+    def fetch_tracked_positions() -> list:
+        positions = fetch_open_positions()
+        for row_id, position in enumerate(positions[::2], start=1):
+            position['id'] = row_id
+        return positions
+
+    kalshi_bot.fetch_open_positions = fetch_tracked_positions
+    return kalshi_bot
+
+
+def main():
+    """Entry point for the profiling harness"""
+    parser = argparse.ArgumentParser(description="Profile one bot.run() against latency-injecting fakes")
+    parser.add_argument('--positions', type=int, default=50, help="number of fake portfolio positions")
+    parser.add_argument('--latency', type=float, default=0.1, help="seconds of fake latency per network call")
+    parser.add_argument('--output', default='profile_run.prof', help="cProfile dump path (or .html with --html)")
+    parser.add_argument('--html', action='store_true', help="render a pyinstrument HTML flame graph instead")
+    parser.add_argument('--verbose', action='store_true', help="show the bot's INFO logs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    kalshi_bot = build_bot(args.positions, args.latency)
+
+    started = time.perf_counter()
+
+    if args.html:
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            sys.exit("pyinstrument is not installed: pip install pyinstrument")
+
+        profiler = Profiler(async_mode='enabled')
+        profiler.start()
+        asyncio.run(kalshi_bot.run())
+        profiler.stop()
+
+        output = args.output if args.output.endswith('.html') else f"{os.path.splitext(args.output)[0]}.html"
+        with open(output, 'w') as f:
+            f.write(profiler.output_html())
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        asyncio.run(kalshi_bot.run())
+        profiler.disable()
+
+        output = args.output
+        profiler.dump_stats(output)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
+
+    elapsed = time.perf_counter() - started
+    print(f"{args.positions} positions, {args.latency * 1000:.0f} ms/call: {elapsed:.2f}s wall time, "
+          f"{kalshi_bot.supabase.upserted} rows upserted -> {output}")
+
+
+if __name__ == "__main__":
+    main()